@@ -1,21 +1,48 @@
 from __future__ import annotations
 
+import asyncio
+import gc
 import logging
 import os
-from typing import Final, Sequence
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Final, Iterable, Sequence
 
 import discord
-from dotenv import load_dotenv
 
 # ロギング初期化
 logging.basicConfig(
     level=logging.INFO,
     format="[%(asctime)s] [%(levelname)s] %(name)s: %(message)s",
 )
+# 書式で使わないスレッド名・プロセス情報・呼び出し元の収集をログごとに行わない
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+logging._srcfile = None
 logger = logging.getLogger("forum_thread_notifier")
 
-# .env を読み込んで環境変数をプロセスに取り込む
-load_dotenv()
+# 通知キューの上限と、複数通知を 1 通にまとめる際の待ち時間・件数
+NOTIFY_QUEUE_SIZE: Final[int] = 256
+BATCH_WINDOW_SECONDS: Final[float] = 0.2
+MAX_BATCH_SIZE: Final[int] = 10
+# Discord のメッセージ文字数上限
+MESSAGE_LIMIT: Final[int] = 2000
+NOTIFICATION_SEPARATOR: Final[str] = "\n\n"
+
+# 通知文面の見出しとスレッド URL の接頭辞
+_HEADER: Final[str] = "**新しいスレッドが作成されました**\n"
+_URL_PREFIX: Final[str] = "https://discord.com/channels/"
+
+
+@dataclass(frozen=True, slots=True)
+class BotConfig:
+    """環境変数から解決したチャンネル設定"""
+
+    forum_channel_ids: frozenset[int]
+    announce_channel_id: int
 
 
 def build_intents() -> discord.Intents:
@@ -26,17 +53,75 @@ def build_intents() -> discord.Intents:
     return intents
 
 
+@lru_cache(maxsize=1024)
+def _mention(owner_id: int | None) -> str:
+    """作成者のメンション文字列 (常連の作成者は使い回す)"""
+    return f"<@{owner_id}>" if owner_id else "不明な作成者"
+
+
 def format_notification(thread: discord.Thread) -> str:
     """通知文面の構築"""
-    thread_url = f"https://discord.com/channels/{thread.guild.id}/{thread.id}"
-    thread_owner = f"<@{thread.owner_id}>" if thread.owner_id else "不明な作成者"
-
-    return (
-        "**新しいスレッドが作成されました**\n"
-        f"{thread.name}"
-        f"{thread_owner}\n"
-        f"{thread_url}"
-    )
+    # CPython 3.11 では % 書式や "".join より f-string が速い
+    return f"{_HEADER}{thread.name}{_mention(thread.owner_id)}\n{_URL_PREFIX}{thread.guild.id}/{thread.id}"
+
+
+def pack_notifications(notifications: Iterable[str], limit: int = MESSAGE_LIMIT) -> list[tuple[str, int]]:
+    """複数の通知文面を文字数上限に収まる単位で連結し、(本文, 含まれる通知数) の一覧を返す"""
+    messages: list[tuple[str, int]] = []
+    current = ""
+    count = 0
+    for text in notifications:
+        candidate = f"{current}{NOTIFICATION_SEPARATOR}{text}" if current else text
+        if current and len(candidate) > limit:
+            messages.append((current, count))
+            current = text
+            count = 1
+        else:
+            current = candidate
+            count += 1
+    if current:
+        messages.append((current, count))
+    return messages
+
+
+def _find_env_file() -> Path | None:
+    """カレントディレクトリ、次いで bot.py と同じディレクトリの .env を探す"""
+    for directory in (Path.cwd(), Path(__file__).resolve().parent):
+        candidate = directory / ".env"
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def _load_env(path: Path | None = None) -> None:
+    """.env の KEY=VALUE 行を読み込み、未設定の環境変数だけを取り込む"""
+    path = path or _find_env_file()
+    if path is None:
+        return
+    try:
+        with open(path, encoding="utf-8") as env_file:
+            lines = env_file.readlines()
+    except FileNotFoundError:
+        return
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.removeprefix("export ").split("=", 1)
+        key = key.strip()
+        if not key:
+            continue
+        value = value.strip()
+        quote = value[:1]
+        closing = value.find(quote, 1) if quote in ("\"", "'") else -1
+        if closing > 0:
+            # クォート内はそのまま、閉じクォート以降 (行末コメントなど) は捨てる
+            value = value[1:closing]
+        else:
+            # クォートなしの値は " #" 以降を行末コメントとして除く
+            value = "" if value.startswith("#") else value.partition(" #")[0].strip()
+        os.environ.setdefault(key, value)
 
 
 def ensure_token() -> str:
@@ -47,25 +132,26 @@ def ensure_token() -> str:
     return token
 
 
-def parse_forum_channel_ids(raw_ids: str) -> list[int]:
+def _parse_forum_channel_id(token: str) -> int:
+    """フォーラムID 1 件分を整数に変換"""
+    try:
+        return int(token)
+    except ValueError as exc:  # ID 文字列以外が混ざっていた場合は早期に知らせる
+        raise ValueError(f"FORUM_CHANNEL_IDS に数値以外の値 '{token}' が含まれています") from exc
+
+
+def parse_forum_channel_ids(raw_ids: str) -> frozenset[int]:
     """
-    監視対象フォーラムID文字列をカンマ区切りでパースして整数リストに変換
+    監視対象フォーラムID文字列をカンマ区切りでパースして整数の集合に変換
     """
-    ids: list[int] = []
-    for chunk in raw_ids.split(","):
-        stripped = chunk.strip()
-        if not stripped:
-            continue
-        try:
-            ids.append(int(stripped))
-        except ValueError as exc:  # ID 文字列以外が混ざっていた場合は早期に知らせる
-            raise ValueError(f"FORUM_CHANNEL_IDS に数値以外の値 '{stripped}' が含まれています") from exc
+    tokens = (chunk.strip() for chunk in raw_ids.split(","))
+    ids = frozenset(_parse_forum_channel_id(token) for token in tokens if token)
     if not ids:
         raise ValueError("FORUM_CHANNEL_IDS に有効なIDが一つもありません")
     return ids
 
 
-def load_channel_settings() -> tuple[list[int], int]:
+def load_channel_settings() -> BotConfig:
     """フォーラムID一覧と通知チャンネルIDを環境変数から取得し、整形"""
     forum_ids_raw = os.getenv("FORUM_CHANNEL_IDS")
     if not forum_ids_raw:
@@ -80,7 +166,7 @@ def load_channel_settings() -> tuple[list[int], int]:
     except ValueError as exc:
         raise ValueError("ANNOUNCE_CHANNEL_ID には数値チャンネルIDを設定してください") from exc
 
-    return forum_ids, announce_channel_id
+    return BotConfig(forum_channel_ids=forum_ids, announce_channel_id=announce_channel_id)
 
 
 class ForumThreadNotifier(discord.Client):
@@ -90,57 +176,208 @@ class ForumThreadNotifier(discord.Client):
         self,
         *,
         intents: discord.Intents,
-        forum_channel_ids: Sequence[int],
-        announce_channel_id: int,
+        config: BotConfig,
     ) -> None:
-        super().__init__(intents=intents)
-        self._forum_channel_ids: Final[frozenset[int]] = frozenset(forum_channel_ids)
-        self._announce_channel_id: Final[int] = announce_channel_id
+        # メンバー・メッセージは参照しないのでキャッシュせず、常駐メモリを抑える
+        super().__init__(
+            intents=intents,
+            chunk_guilds_at_startup=False,
+            member_cache_flags=discord.MemberCacheFlags.none(),
+            max_messages=None,
+        )
+        self._config: Final[BotConfig] = config
+        self._announce_channel: discord.abc.Messageable | None = None
+        self._queue: asyncio.Queue[discord.Thread] = asyncio.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        self._worker: asyncio.Task[None] | None = None
+        self._dropped_notifications = 0
+
+    async def setup_hook(self) -> None:
+        """送信ワーカーをイベントディスパッチとは別タスクで起動"""
+        self._worker = asyncio.create_task(self._drain_notifications())
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+        await super().close()
+
+    def _find_announce_channel(self, guild: discord.Guild) -> discord.abc.Messageable | None:
+        """ギルドのキャッシュから送信可能な通知チャンネルを探す"""
+        channel = guild.get_channel(self._config.announce_channel_id)
+        return channel if isinstance(channel, discord.abc.Messageable) else None
+
+    async def _resolve_announce_channel(self) -> None:
+        """通知チャンネルを引き当てて保持し、ついでに REST の接続を張り直しておく"""
+        announce_channel_id = self._config.announce_channel_id
+        cached: discord.abc.Messageable | None = None
+        for guild in self.guilds:
+            cached = self._find_announce_channel(guild)
+            if cached is not None:
+                self._announce_channel = cached
+                break
+
+        # ゲートウェイ接続中にアイドルで切れた REST 接続を張り直す (キャッシュに無い場合の取得も兼ねる)。
+        # 効果があるのは aiohttp の keep-alive 期間 (既定で約 15 秒) 内に送る通知だけ
+        try:
+            fetched = await self.fetch_channel(announce_channel_id)
+        except discord.HTTPException:
+            fetched = None
+        # await 中に削除イベントでキャッシュが消された場合に、削除済みチャンネルを戻さない
+        if cached is None and isinstance(fetched, discord.abc.Messageable):
+            self._announce_channel = fetched
+
+        if self._announce_channel is None:
+            logger.error(
+                "Announce channel %s が取得できません。権限やIDを確認してください",
+                announce_channel_id,
+            )
 
     async def on_ready(self) -> None:
-        logger.info("Bot logged in as %s (id=%s)", self.user, getattr(self.user, "id", "unknown"))
+        user = self.user
+        logger.info("Bot logged in as %s (id=%s)", user, user.id if user else "unknown")
+        await self._resolve_announce_channel()
+
+    async def on_guild_available(self, guild: discord.Guild) -> None:
+        """再接続でギルドが復帰したらチャンネルを取り直す"""
+        channel = self._find_announce_channel(guild)
+        if channel is not None:
+            self._announce_channel = channel
+
+    async def on_guild_join(self, guild: discord.Guild) -> None:
+        """起動後にサーバーへ招待された場合もチャンネルを取り込む"""
+        channel = self._find_announce_channel(guild)
+        if channel is not None:
+            self._announce_channel = channel
+
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel) -> None:
+        if channel.id == self._config.announce_channel_id:
+            logger.error("Announce channel %s が削除されました", channel.id)
+            self._announce_channel = None
 
     async def on_thread_create(self, thread: discord.Thread) -> None:
-        """新規スレッド作成を通知"""
-        if thread.parent_id not in self._forum_channel_ids:
-            logger.debug(
-                "Ignore thread %s (id=%s) because parent %s is not monitored",
+        """新規スレッド作成を通知 (await を挟まないので、一度も中断せずに完了する)"""
+        parent_id = thread.parent_id
+        if parent_id not in self._config.forum_channel_ids:
+            # 監視対象外は頻出するので、DEBUG 無効時は引数の組み立て自体を省く
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Ignore thread %s (id=%s) because parent %s is not monitored",
+                    thread.name,
+                    thread.id,
+                    parent_id,
+                )
+            return
+
+        # 送信はワーカーに任せ、ゲートウェイのディスパッチを REST の待ち時間で塞がない
+        try:
+            self._queue.put_nowait(thread)
+        except asyncio.QueueFull:
+            self._dropped_notifications += 1
+            logger.warning(
+                "通知キューが満杯のためスレッド %s (id=%s) の通知を破棄しました (累計 %d 件)",
                 thread.name,
                 thread.id,
-                thread.parent_id,
+                self._dropped_notifications,
             )
-            return
 
-        announce_channel = thread.guild.get_channel(self._announce_channel_id)
+    async def _drain_notifications(self) -> None:
+        """キューに溜まったスレッドを短時間まとめてから通知"""
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < MAX_BATCH_SIZE:
+                try:
+                    thread = await asyncio.wait_for(self._queue.get(), timeout=BATCH_WINDOW_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(thread)
+
+            # OSError など想定外の例外でワーカーが止まると以降の通知がすべて失われるので、
+            # ここで握りつぶして次のバッチに進む (CancelledError は BaseException なので通過する)
+            try:
+                await self._send_batch(batch)
+            except Exception:
+                logger.exception(
+                    "通知の送信中に予期しないエラーが発生しました (スレッドID: %s)",
+                    ", ".join(str(thread.id) for thread in batch),
+                )
+
+    async def _send_batch(self, batch: Sequence[discord.Thread]) -> None:
+        """まとめたスレッド群を通知チャンネルへ送信"""
+        announce_channel = self._announce_channel
         if announce_channel is None:
             logger.error(
                 "Announce channel %s が取得できません。権限やIDを確認してください",
-                self._announce_channel_id,
+                self._config.announce_channel_id,
             )
             return
 
-        message = format_notification(thread)
-        await announce_channel.send(message)
-        logger.info(
-            "Notified new thread '%s' (id=%s) in parent %s",
-            thread.name,
-            thread.id,
-            thread.parent_id,
-        )
+        start = 0
+        for message, count in pack_notifications(map(format_notification, batch)):
+            threads = batch[start : start + count]
+            start += count
+            try:
+                await announce_channel.send(message)
+            except discord.HTTPException:
+                # 失敗した分だけ記録し、残りのメッセージは送信を続ける
+                logger.exception(
+                    "通知の送信に失敗しました (スレッドID: %s)",
+                    ", ".join(str(thread.id) for thread in threads),
+                )
+                continue
+
+            if not logger.isEnabledFor(logging.INFO):
+                continue
+            for thread in threads:
+                logger.info(
+                    "Notified new thread '%s' (id=%s) in parent %s",
+                    thread.name,
+                    thread.id,
+                    thread.parent_id,
+                )
+
+
+def install_event_loop_policy() -> None:
+    """uvloop が利用可能なら asyncio のイベントループを差し替える"""
+    if sys.platform == "win32":  # uvloop は Windows 非対応
+        return
+    try:
+        import uvloop
+    except ImportError:
+        logger.debug("uvloop が見つからないため標準の asyncio イベントループを使用します")
+        return
+
+    # Client.run 内の asyncio.run がこのポリシーでループを生成する
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("Using uvloop event loop")
+
+
+def tune_gc() -> None:
+    """常駐プロセス向けに GC の頻度を下げ、起動時に作ったオブジェクトを走査対象から外す"""
+    if os.getenv("DISABLE_GC_TUNING"):
+        logger.info("GC tuning disabled by DISABLE_GC_TUNING")
+        return
+
+    gc.set_threshold(50_000, 10, 10)
+    # 循環参照のゴミを先に回収しておかないと、freeze で永久世代に移って二度と解放されない
+    gc.collect()
+    gc.freeze()
 
 
 def main() -> None:
     """Bot の起動エントリポイント"""
+    # .env を読み込んで、未設定の環境変数だけをプロセスに取り込む
+    _load_env()
+
     token = ensure_token()
-    forum_channel_ids, announce_channel_id = load_channel_settings()
+    config = load_channel_settings()
     intents = build_intents()
+    install_event_loop_policy()
     client = ForumThreadNotifier(
         intents=intents,
-        forum_channel_ids=forum_channel_ids,
-        announce_channel_id=announce_channel_id,
+        config=config,
     )
 
-    logger.info("Starting bot with monitored forums: %s", forum_channel_ids)
+    logger.info("Starting bot with monitored forums: %s", sorted(config.forum_channel_ids))
+    tune_gc()
     client.run(token)
 
 